@@ -4,27 +4,66 @@ import dash_leaflet as dl
 import dash_leaflet.express as dlx
 from dash_extensions.javascript import assign
 from dash.dependencies import Input, Output, State
+import flask
+import gzip
+import hashlib
+import logging
+import numpy as np
+import orjson
 import pandas as pd
-import requests
 from home_capacity_viewer.llm_handler import LLMQueryHandler
 from home_capacity_viewer.data_processor import DataProcessor
-from home_capacity_viewer.database import DatabaseManager
+from home_capacity_viewer.database import DatabaseManager, get_db_manager
+from home_capacity_viewer.geojson_loader import load_geojson
+
+# Show the database and GeoJSON loading progress messages, without changing the root logger
+# (which would also turn on INFO logs from httpx and whatever WSGI server hosts the app)
+package_logger = logging.getLogger('home_capacity_viewer')
+if not package_logger.handlers:
+    log_handler = logging.StreamHandler()
+    log_handler.setFormatter(logging.Formatter('%(message)s'))
+    package_logger.addHandler(log_handler)
+package_logger.setLevel(logging.INFO)
 
 # Initialize Dash app
 app = Dash(__name__, external_stylesheets=[dbc.themes.LUX])
 
 # Initialize database
-db_manager = DatabaseManager("sqlite:///home_capacity_data.db")
+db_manager = get_db_manager("sqlite:///home_capacity_data.db")
 db_manager.create_tables()
 
-# Load GeoJSON data
-geojson_url = 'https://services1.arcgis.com/ESMARspQHYMw9BZ9/arcgis/rest/services/Local_Authority_Districts_May_2024_Boundaries__UK_BSC/FeatureServer/0/query?outFields=*&where=1%3D1&f=geojson'
-response = requests.get(geojson_url)
-geojson_data = response.json()
+# Load GeoJSON data (downloaded once, then read from the local cache)
+geojson_url = 'https://services1.arcgis.com/ESMARspQHYMw9BZ9/arcgis/rest/services/Local_Authority_Districts_May_2024_Boundaries__UK_BSC/FeatureServer/0/query?outFields=LAD24CD%2CLAD24NM&where=1%3D1&f=geojson'
+geojson_data = load_geojson(geojson_url, 'cache/lads_simplified.geojson.gz')
+
+# Serialise the boundaries once and serve them from their own route, so the geometry is neither
+# embedded in nor re-encoded with the Dash layout on every page load
+geojson_bytes = orjson.dumps(geojson_data)
+geojson_gzip_bytes = gzip.compress(geojson_bytes)
+geojson_etag = hashlib.blake2b(geojson_bytes, digest_size=16).hexdigest()
+
+@app.server.route('/data/lads.geojson')
+def serve_geojson():
+    if flask.request.accept_encodings['gzip']:
+        response = flask.Response(geojson_gzip_bytes, mimetype='application/json', headers={'Content-Encoding': 'gzip'})
+        response.set_etag(f"{geojson_etag}-gzip")
+    else:
+        response = flask.Response(geojson_bytes, mimetype='application/json')
+        response.set_etag(geojson_etag)
+    
+    # The boundaries only change when the cache is rebuilt, so let browsers keep them and
+    # revalidate with the ETag (answered with an empty 304) instead of re-downloading
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    response.vary.add('Accept-Encoding')
+    return response.make_conditional(flask.request)
 
-# Load CSV data
-water_output_csv = pd.read_csv('src/data/LA_water_output.csv')
-energy_output_csv = pd.read_csv('src/data/LA_energy_output.csv')
+# Load CSV data, parsing every year column straight to float64 rather than leaving pandas to infer column types
+forecast_dtypes = {'LAD24CD': str, 'LAD24NM': str, **DatabaseManager.YEAR_DTYPES}
+water_output_csv = pd.read_csv('src/data/LA_water_output.csv', dtype=forecast_dtypes)
+energy_output_csv = pd.read_csv('src/data/LA_energy_output.csv', dtype=forecast_dtypes)
+
+# Forecast years available in the CSVs (every column except the LAD code and name)
+YEAR_COLS = tuple(sorted(int(col) for col in water_output_csv.columns if col not in ('LAD24CD', 'LAD24NM')))
 
 # Process data for display (with risk levels)
 display_processor = DataProcessor(water_output_csv, energy_output_csv)
@@ -34,10 +73,11 @@ processed_water_data, processed_energy_data, processed_home_capacity = display_p
 db_processor = DataProcessor(water_output_csv, energy_output_csv)
 db_water_data, db_energy_data, db_home_capacity = db_processor.process_data(convert_water_to_risk_level=False)
 
-# Load data into database
-db_manager.load_data(db_water_data, 'water')
-db_manager.load_data(db_energy_data, 'energy')
-db_manager.load_data(db_home_capacity, 'home_capacity')
+# Load data into database, building the indexes once after the rows are in
+with db_manager.bulk_load_context():
+    db_manager.load_data(db_water_data, 'water')
+    db_manager.load_data(db_energy_data, 'energy')
+    db_manager.load_data(db_home_capacity, 'home_capacity')
 
 
 # Define colorscale (these colors will be used for both water and energy data)
@@ -45,121 +85,73 @@ neg_colors = ['#8B2E23', '#C05746', '#E8998D']  # Reds for negative values
 pos_colors = ['#9DC08B', '#609966', '#315C2B', '#254D20', '#1A3D15']  # Greens for positive values
 colorscale = neg_colors + pos_colors[1:] + ['#A9A9A9']  # Add grey for missing data
 
-# Function to update GeoJSON data with values for a specific year
-def update_geojson_data(year, data_source='water'):
-    csv_data = energy_output_csv if data_source == 'energy' else water_output_csv
-    
-    # Get min and max values for color scaling
-    values = []
-    for feature in geojson_data['features']:
-        lad24cd = feature["properties"]["LAD24CD"]
-        try:
-            value = csv_data[csv_data["LAD24CD"] == lad24cd][str(year)].values[0]
-            values.append(value)
-        except:
-            pass
+# Function to build the per-LAD values, colour buckets and colorbar categories for a specific year.
+# Values and buckets are lists aligned with the CSV's LAD24CD column.
+def build_year_bundle(csv_data, year):
+    vals = csv_data[str(year)].to_numpy(dtype=np.float64)
+    missing = np.isnan(vals)
+    min_val, max_val = float(np.nanmin(vals)), float(np.nanmax(vals))
     
-    global min_val, max_val, classes, colorbar
-    min_val = min(values)
-    max_val = max(values)
+    # Classes: negative values use the red scale, zero and positive values the green scale
+    classes = np.array([min_val, min_val/2, 0, max_val/4, max_val/2, max_val*0.75, max_val])
     
-    # Update classes
-    neg_classes = [min_val, min_val/2, 0]
-    pos_classes = [0, max_val/4, max_val/2, max_val*0.75, max_val]
-    classes = neg_classes + pos_classes[1:] + [1000]
+    # Colorbar categories: one label per band, with the top green band open-ended
+    ctg = [f"{lo:.1f} to {hi:.1f}" for lo, hi in zip(classes[:5], classes[1:6])]
+    ctg += [f"{classes[5]:.1f}+", "No data"]
     
-    # Update colorbar categories
-    ctg = []
-    for i in range(len(neg_classes)-1):
-        ctg.append(f"{neg_classes[i]:.1f} to {neg_classes[i+1]:.1f}")
-    for i in range(len(pos_classes)-1):
-        if i == len(pos_classes)-2:
-            ctg.append(f"{pos_classes[i]:.1f}+")
-        else:
-            ctg.append(f"{pos_classes[i]:.1f} to {pos_classes[i+1]:.1f}")
-    ctg.append("No data")
-    
-    # Update colorbar
-    colorbar = dlx.categorical_colorbar(
-        categories=ctg,
-        colorscale=colorscale,
-        width=500,
-        height=30,
-        position="bottomleft"
+    # Bucket each value into the first class bound it does not exceed. Negative values use the
+    # three red classes, zero and positive values the green classes, capped at the last green.
+    # Regions with no value for this year are grey rather than falling into the top bucket.
+    buckets = np.where(
+        vals < 0,
+        np.digitize(vals, classes[:3], right=True),
+        3 + np.digitize(vals, classes[3:], right=True)
     )
+    buckets = np.where(missing, len(colorscale) - 1, np.minimum(buckets, len(colorscale) - 2))
     
-    # Update feature values
-    for feature in geojson_data['features']:
-        lad24cd = feature["properties"]["LAD24CD"]
-        try:
-            value = csv_data[csv_data["LAD24CD"] == lad24cd][str(year)].values[0]
-            feature["properties"]["value"] = value
-        except:
-            feature["properties"]["value"] = 1000
-    
-    return geojson_data
+    # Values are only shown to 2 decimal places, so round them to keep the browser store small
+    return {
+        'buckets': buckets.tolist(),
+        'values': [None if m else v for m, v in zip(missing, np.round(vals, 2).tolist())],
+        'ctg': ctg
+    }
 
-# Initialize with 2025 water data
-geojson_data = update_geojson_data(2025, 'water')
-
-# Define initial classes
-values = [feature["properties"]["value"] for feature in geojson_data['features'] if feature["properties"]["value"] != 1000]
-min_val = min(values)
-max_val = max(values)
-
-# For negative values (red scale)
-neg_classes = [min_val, min_val/2, 0]
-pos_classes = [0, max_val/4, max_val/2, max_val*0.75, max_val]
-classes = neg_classes + pos_classes[1:] + [1000]
-
-# Create initial colorbar
-ctg = []
-for i in range(len(neg_classes)-1):
-    ctg.append(f"{neg_classes[i]:.1f} to {neg_classes[i+1]:.1f}")
-for i in range(len(pos_classes)-1):
-    if i == len(pos_classes)-2:
-        ctg.append(f"{pos_classes[i]:.1f}+")
-    else:
-        ctg.append(f"{pos_classes[i]:.1f} to {pos_classes[i+1]:.1f}")
-ctg.append("No data")
+# The CSVs are static, so build every (data source, year) bundle once at startup. This is sent to
+# the browser once in a dcc.Store, and slider moves are then handled entirely client side.
+PRECOMPUTED = {'colorscale': colorscale}
+for data_source, csv_data in (('water', water_output_csv), ('energy', energy_output_csv)):
+    PRECOMPUTED[data_source] = {
+        'codes': csv_data["LAD24CD"].tolist(),
+        'years': {str(year): build_year_bundle(csv_data, year) for year in YEAR_COLS}
+    }
+
+# Function to build the GeoJSON hideout for a specific year. The polygons are sent to the
+# browser once; slider moves only swap the per-LAD fill colours and values held in the hideout.
+# Mirrors the clientside callback that rebuilds the hideout from the store.
+def get_hideout(year, data_source='water'):
+    codes = PRECOMPUTED[data_source]['codes']
+    bundle = PRECOMPUTED[data_source]['years'][str(year)]
+    return dict(
+        colors={code: colorscale[bucket] for code, bucket in zip(codes, bundle['buckets'])},
+        values={code: value for code, value in zip(codes, bundle['values']) if value is not None},
+        missingColor=colorscale[-1],
+        style=dict(weight=2, opacity=1, color="white", dashArray="3", fillOpacity=0.7)
+    )
 
+# Initialize with 2025 water data
 colorbar = dlx.categorical_colorbar(
-    categories=ctg,
+    id="colorbar",
+    categories=PRECOMPUTED['water']['years']['2025']['ctg'],
     colorscale=colorscale,
-    width=400,
+    width=500,
     height=30,
     position="bottomleft"
 )
 
-# Geojson rendering logic
+# Geojson rendering logic - fill colours are precomputed per LAD, regions without data are grey
 style_handle = assign("""function(feature, context){
-    const {classes, colorscale, style, colorProp} = context.hideout;
-    const value = feature.properties[colorProp];
-    
-    if (value === 1000) {
-        style.fillColor = colorscale[colorscale.length - 1];  // Use last color (dark grey) for missing data
-        return style;
-    }
-    
-    if (value < 0) {  // Handle negative values
-        for (let i = 0; i < 3; ++i) {  // 3 is the number of negative classes
-            if (value <= classes[i]) {
-                style.fillColor = colorscale[i];
-                break;
-            }
-        }
-    } else {  // Handle zero and positive values
-        for (let i = 3; i < classes.length - 1; ++i) {  // Start from first positive class
-            if (value <= classes[i]) {
-                style.fillColor = colorscale[i];
-                break;
-            }
-        }
-        // If no class matched (value is greater than all class boundaries)
-        if (value > classes[classes.length - 2]) {
-            style.fillColor = colorscale[classes.length - 2];  // Use the last color before grey
-        }
-    }
+    const {colors, missingColor, style} = context.hideout;
+    style.fillColor = colors[feature.properties.LAD24CD] || missingColor;
     return style;
 }""")
 
@@ -167,24 +159,9 @@ style_handle = assign("""function(feature, context){
 # Initialize LLM query handler
 llm_handler = LLMQueryHandler(water_output_csv, energy_output_csv)
 
-# Create info control
-def get_info(feature=None, data_source='water'):
-    title = "Water Supply Forecast" if data_source == 'water' else "Energy Supply Forecast"
-    header = [html.H4(title)]
-    if not feature:
-        return header + [html.P("Hover over a region")]
-    
-    value = feature["properties"]["value"]
-    value_display = "No data" if value == 1000 else f"{value:.2f}"
-    
-    return header + [
-        html.B(feature["properties"]["LAD24NM"]),
-        html.Br(),
-        f"Value: {value_display}"
-    ]
-
+# Create info control (its contents are updated by a clientside callback on hover)
 info = html.Div(
-    children=get_info(),
+    children=[html.H4("Water Supply Forecast"), html.P("Hover over a region")],
     id="info",
     className="info",
     style={"position": "absolute", "top": "10px", "right": "10px", "zIndex": "1000", "background": "white", "padding": "10px"}
@@ -208,16 +185,11 @@ map_component = html.Div([
     dl.Map(center=[54.5, -3.4380], zoom=5.4, children=[
         dl.TileLayer(url='https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png'),
         dl.GeoJSON(
-            data=geojson_data,
+            url=app.get_relative_path('/data/lads.geojson'),
             id="geojson",
             options=dict(style=style_handle),
             hoverStyle=dict(weight=5, color="#666", dashArray=""),
-            hideout=dict(
-                colorscale=colorscale,
-                classes=classes,
-                style=dict(weight=2, opacity=1, color="white", dashArray="3", fillOpacity=0.7),
-                colorProp="value"
-            ),
+            hideout=get_hideout(2025, 'water'),
             children=[dl.Tooltip(id="tooltip")]
         ),
         colorbar,
@@ -228,15 +200,16 @@ map_component = html.Div([
     
     dcc.Slider(
         id='time-slider',
-        min=min(int(col) for col in water_output_csv.drop(columns=['LAD24CD', 'LAD24NM']).columns),
-        max=max(int(col) for col in water_output_csv.drop(columns=['LAD24CD', 'LAD24NM']).columns),
+        min=YEAR_COLS[0],
+        max=YEAR_COLS[-1],
         value=2025,
         marks={str(year): {'label': str(year), 'style': {'transform': 'rotate(45deg)', 'whiteSpace': 'nowrap'}} 
-               for year in range(min(int(col) for col in water_output_csv.drop(columns=['LAD24CD', 'LAD24NM']).columns), 
-                               max(int(col) for col in water_output_csv.drop(columns=['LAD24CD', 'LAD24NM']).columns) + 1)},
+               for year in YEAR_COLS},
         step=None
-    )], style={'padding': '20px'}
-)
+    ),
+    
+    dcc.Store(id="map-data", data=PRECOMPUTED)
+], style={'padding': '20px'})
 
 # Text query component
 text_query = html.Div(
@@ -319,57 +292,65 @@ app.layout = html.Div([
     ], style={'padding': '20px', 'backgroundColor': '#f8f9fa'})
 ])
 
-# Callback for info box
-@app.callback(
+# Clientside callback for info box - hover events fire constantly, so they are handled in the
+# browser using the values already held in the GeoJSON hideout rather than a server round-trip
+app.clientside_callback(
+    """function(feature, data_source, hideout){
+        const component = (type, children) => ({namespace: 'dash_html_components', type: type, props: {children: children}});
+        const title = data_source === 'water' ? 'Water Supply Forecast' : 'Energy Supply Forecast';
+        if (!feature) {
+            return [component('H4', title), component('P', 'Hover over a region')];
+        }
+        
+        const value = hideout.values[feature.properties.LAD24CD];
+        const valueDisplay = value === undefined ? 'No data' : value.toFixed(2);
+        
+        return [
+            component('H4', title),
+            component('B', feature.properties.LAD24NM),
+            component('Br', null),
+            'Value: ' + valueDisplay
+        ];
+    }""",
     Output("info", "children"),
     [Input("geojson", "hoverData"),
-     Input("data-source-checklist", "value")]
+     Input("data-source-checklist", "value"),
+     Input("geojson", "hideout")]
 )
-def info_hover(feature, data_source):
-    return get_info(feature, data_source)
 
-# Callback for tooltip
-@app.callback(
+# Clientside callback for tooltip
+app.clientside_callback(
+    """function(feature){
+        return feature ? feature.properties.LAD24NM : null;
+    }""",
     Output("tooltip", "children"),
     [Input("geojson", "hoverData")]
 )
-def update_tooltip(feature):
-    if feature is not None:
-        return feature["properties"]["LAD24NM"]
-    return None
 
-# Callback to update GeoJSON data based on slider and data source
-@app.callback(
-    [Output("geojson", "data"),
-     Output("map", "children")],  # Add output for map children to update colorbar
+# Clientside callback to update the map colouring based on slider and data source. The hideout
+# and colorbar labels are rebuilt from the precomputed store, so slider moves need no server
+# round-trip and the polygon geometry is never re-sent.
+app.clientside_callback(
+    """function(year, data_source, store, hideout){
+        const source = store[data_source];
+        const bundle = source.years[year];
+        const colors = {};
+        const values = {};
+        source.codes.forEach((code, i) => {
+            colors[code] = store.colorscale[bundle.buckets[i]];
+            if (bundle.values[i] !== null) {
+                values[code] = bundle.values[i];
+            }
+        });
+        return [Object.assign({}, hideout, {colors: colors, values: values}), bundle.ctg];
+    }""",
+    [Output("geojson", "hideout"),
+     Output("colorbar", "tickText")],
     [Input("time-slider", "value"),
-     Input("data-source-checklist", "value")]
+     Input("data-source-checklist", "value")],
+    [State("map-data", "data"),
+     State("geojson", "hideout")]
 )
-def update_geojson(year, data_source):
-    # Update the GeoJSON data
-    geojson_data = update_geojson_data(year, data_source)
-    
-    # Recreate the map with updated colorbar
-    map_children = [
-        dl.TileLayer(url='https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png'),
-        dl.GeoJSON(
-            data=geojson_data,
-            id="geojson",
-            options=dict(style=style_handle),
-            hoverStyle=dict(weight=5, color="#666", dashArray=""),
-            hideout=dict(
-                colorscale=colorscale,
-                classes=classes,
-                style=dict(weight=2, opacity=1, color="white", dashArray="3", fillOpacity=0.7),
-                colorProp="value"
-            ),
-            children=[dl.Tooltip(id="tooltip")]
-        ),
-        colorbar,
-        info
-    ]
-    
-    return geojson_data, map_children
 
 # Callback to update text output
 @app.callback(
@@ -383,33 +364,40 @@ def update_text_output(n_submit, query):
         return response
     return 'Press Enter to submit your question'
 
+# Function to build a data table for a processed dataframe
+def build_data_table(data):
+    return dash_table.DataTable(
+        data=data.to_dict('records'),
+        columns=[{"name": i, "id": i} for i in data.columns],
+        page_size=10,
+        filter_action="native",
+        sort_action="native",
+        style_table={'overflowX': 'auto'},
+        style_cell={
+            'textAlign': 'left',
+            'padding': '10px',
+            'whiteSpace': 'normal',
+            'height': 'auto',
+        },
+        style_header={
+            'backgroundColor': '#011638',
+            'color': 'white',
+            'fontWeight': 'bold'
+        }
+    )
+
+# The processed data is static, so build each table once rather than on every tab click
+ENERGY_TABLE = build_data_table(processed_energy_data)
+WATER_TABLE = build_data_table(processed_water_data)
+HOME_CAPACITY_TABLE = build_data_table(processed_home_capacity)
+
 # Callback to display energy data table
 @app.callback(
     Output('energy-table-container', 'children'),
     Input('tabs', 'active_tab')
 )
 def display_energy_table(active_tab):
-    if active_tab == 'tab-energy':
-        return dash_table.DataTable(
-            data=processed_energy_data.to_dict('records'),
-            columns=[{"name": i, "id": i} for i in processed_energy_data.columns],
-            page_size=10,
-            filter_action="native",
-            sort_action="native",
-            style_table={'overflowX': 'auto'},
-            style_cell={
-                'textAlign': 'left',
-                'padding': '10px',
-                'whiteSpace': 'normal',
-                'height': 'auto',
-            },
-            style_header={
-                'backgroundColor': '#011638',
-                'color': 'white',
-                'fontWeight': 'bold'
-            }
-        )
-    return None
+    return ENERGY_TABLE if active_tab == 'tab-energy' else None
 
 # Callback to display water data table
 @app.callback(
@@ -417,27 +405,7 @@ def display_energy_table(active_tab):
     Input('tabs', 'active_tab')
 )
 def display_water_table(active_tab):
-    if active_tab == 'tab-water':
-        return dash_table.DataTable(
-            data=processed_water_data.to_dict('records'),
-            columns=[{"name": i, "id": i} for i in processed_water_data.columns],
-            page_size=10,
-            filter_action="native",
-            sort_action="native",
-            style_table={'overflowX': 'auto'},
-            style_cell={
-                'textAlign': 'left',
-                'padding': '10px',
-                'whiteSpace': 'normal',
-                'height': 'auto',
-            },
-            style_header={
-                'backgroundColor': '#011638',
-                'color': 'white',
-                'fontWeight': 'bold'
-            }
-        )
-    return None
+    return WATER_TABLE if active_tab == 'tab-water' else None
 
 # Callback to display home capacity table
 @app.callback(
@@ -445,27 +413,7 @@ def display_water_table(active_tab):
     Input('tabs', 'active_tab')
 )
 def display_home_capacity_table(active_tab):
-    if active_tab == 'tab-capacity':
-        return dash_table.DataTable(
-            data=processed_home_capacity.to_dict('records'),
-            columns=[{"name": i, "id": i} for i in processed_home_capacity.columns],
-            page_size=10,
-            filter_action="native",
-            sort_action="native",
-            style_table={'overflowX': 'auto'},
-            style_cell={
-                'textAlign': 'left',
-                'padding': '10px',
-                'whiteSpace': 'normal',
-                'height': 'auto',
-            },
-            style_header={
-                'backgroundColor': '#011638',
-                'color': 'white',
-                'fontWeight': 'bold'
-            }
-        )
-    return None
+    return HOME_CAPACITY_TABLE if active_tab == 'tab-capacity' else None
     
 
 
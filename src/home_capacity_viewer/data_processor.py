@@ -1,17 +1,35 @@
+import numpy as np
 import pandas as pd
 from typing import Dict, Tuple
 
 class DataProcessor:
-    def __init__(self, water_data: pd.DataFrame, energy_data: pd.DataFrame):
+    # Water value bins for new home construction risk levels: <= -1, (-1, 0], (0, 1] and > 1
+    WATER_RISK_BINS = [-np.inf, -1, 0, 1, np.inf]
+    WATER_RISK_LEVELS = ["High risk deficit", "Low risk deficit", "Low capacity", "High capacity"]
+
+    def __init__(self, water_data: pd.DataFrame, energy_data: pd.DataFrame, copy: bool = True):
         """
         Initialize the data processor with water and energy dataframes.
         
         Args:
             water_data (pd.DataFrame): Raw water supply data
             energy_data (pd.DataFrame): Raw energy supply data
+            copy (bool): If True, work on shallow copies so the passed dataframes are left untouched.
+                         If False, columns of the passed dataframes are replaced during processing,
+                         so the caller must not reuse them. Defaults to True.
         """
-        self.water_data = water_data.copy()
-        self.energy_data = energy_data.copy()
+        # Processing only ever replaces whole columns, never writes into existing ones,
+        # so a shallow copy is enough to protect the caller's data without duplicating the values
+        self.water_data = water_data.copy(deep=False) if copy else water_data
+        self.energy_data = energy_data.copy(deep=False) if copy else energy_data
+        
+        # Year columns (all columns except LAD24CD and LAD24NM), shared by every processing step
+        self.year_cols = [col for col in self.water_data.columns if col not in ['LAD24CD', 'LAD24NM']]
+        
+        # LAD codes and names are short strings repeated in every table, so store them as categories
+        for data in (self.water_data, self.energy_data):
+            for col in ['LAD24CD', 'LAD24NM']:
+                data[col] = data[col].astype('category')
         
     def process_data(self, convert_water_to_risk_level: bool = True) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """
@@ -36,37 +54,32 @@ class DataProcessor:
     
     def _categorise_water_data(self):
         """Process water data and add derived columns."""
-        # Get year columns
-        year_cols = [col for col in self.water_data.columns if col not in ['LAD24CD', 'LAD24NM']]
+        year_cols = self.year_cols
         
-        # Convert values to risk levels after calculations if requested
-        for year in year_cols:
-            self.water_data[year] = self.water_data[year].apply(
-                lambda x: self._get_water_risk_level(x)
-            )
+        # Bin every year column in one pass, marking missing values as "No data"
+        values = self.water_data[year_cols].to_numpy(dtype=np.float64)
+        levels = pd.cut(values.ravel(), bins=self.WATER_RISK_BINS, labels=self.WATER_RISK_LEVELS)
+        levels = levels.add_categories("No data").fillna("No data")
+        self.water_data[year_cols] = np.asarray(levels, dtype=object).reshape(values.shape)
 
     def _process_home_capacity(self) -> pd.DataFrame:
         """Process home capacity - this is calculated by assuming that if there is both water and energy supply,
         the home capacity is dictated by the size of the energy supply. Water supply is treated as a 
         probability of water supply (/risk score), and is therefore is only used as a binary variable."""
 
-        year_cols = [col for col in self.water_data.columns if col not in ['LAD24CD', 'LAD24NM']]
-        binary_water_table = self.water_data[year_cols].map(lambda x: 1 if x > 0 else 0)
-        filtered_energy_table = self.energy_data[year_cols].map(lambda x: x if x > 0 else 0)
+        year_cols = self.year_cols
+
+        # The source files are sorted differently, so line energy rows up with water rows by LAD code
+        water = self.water_data[year_cols].to_numpy(dtype=np.float64)
+        energy = (self.energy_data.set_index('LAD24CD')[year_cols]
+                  .reindex(self.water_data['LAD24CD']).to_numpy(dtype=np.float64))
 
-        home_capacity = binary_water_table[year_cols] * filtered_energy_table[year_cols]
+        # Clip and mask in place in the reindexed energy buffer, avoiding float temporaries.
+        # fmax maps missing energy values to 0 and NaN > 0 is False, so missing values give no capacity.
+        np.fmax(energy, 0.0, out=energy)
+        np.multiply(energy, water > 0, out=energy)
+
+        home_capacity = pd.DataFrame(energy, columns=year_cols, index=self.water_data.index)
         home_capacity = pd.concat([self.water_data[['LAD24CD', 'LAD24NM']], home_capacity], axis=1)
 
         self.home_capacity = home_capacity
-
-    
-    def _get_water_risk_level(self, value: float) -> str:
-        """Convert water value to risk level for new home construction."""
-        if value > 1:
-            return "High capacity"
-        elif value > 0:
-            return "Low capacity"
-        elif value > -1:
-            return "Low risk deficit"
-        else:
-            return "High risk deficit" 
\ No newline at end of file
@@ -1,130 +1,174 @@
-from sqlalchemy import create_engine, Column, String, Float, Integer, DateTime
+import contextlib
+import functools
+import logging
+from sqlalchemy import create_engine, event, make_url, Column, String, Float, Integer, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import declared_attr, sessionmaker
+from sqlalchemy.pool import StaticPool
 from sqlalchemy.sql import func
 import pandas as pd
 
-Base = declarative_base()
+logger = logging.getLogger(__name__)
 
-# Helper function to create year columns
-def create_year_columns(start_year=2025, end_year=2050):
-    """Create year columns for database models"""
-    return {f'year_{year}': Column(Float) for year in range(start_year, end_year + 1)}
+Base = declarative_base()
 
-class WaterData(Base):
-    """SQLAlchemy model for processed water supply data"""
-    __tablename__ = 'water_data'
-    
+class YearlyValueMixin:
+    """Shared columns for tables holding one value per (LAD, year)"""
     id = Column(Integer, primary_key=True)
-    lad24cd = Column(String(10), nullable=False, index=True)
+    lad24cd = Column(String(10), nullable=False)
     lad24nm = Column(String(100), nullable=False)
-    
-    # Add year columns dynamically
-    locals().update(create_year_columns())
+    year = Column(Integer, nullable=False, index=True)
+    value = Column(Float)
     
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    @declared_attr
+    def __table_args__(cls):
+        return (Index(f'ix_{cls.__tablename__}_lad24cd_year', 'lad24cd', 'year'),)
 
-class EnergyData(Base):
+class WaterData(YearlyValueMixin, Base):
+    """SQLAlchemy model for processed water supply data"""
+    __tablename__ = 'water_data'
+
+class EnergyData(YearlyValueMixin, Base):
     """SQLAlchemy model for processed energy supply data"""
     __tablename__ = 'energy_data'
-    
-    id = Column(Integer, primary_key=True)
-    lad24cd = Column(String(10), nullable=False, index=True)
-    lad24nm = Column(String(100), nullable=False)
-    
-    # Add year columns dynamically
-    locals().update(create_year_columns())
-    
-    created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
-class HomeCapacityData(Base):
+class HomeCapacityData(YearlyValueMixin, Base):
     """SQLAlchemy model for calculated home capacity data"""
     __tablename__ = 'home_capacity_data'
-    
-    id = Column(Integer, primary_key=True)
-    lad24cd = Column(String(10), nullable=False, index=True)
-    lad24nm = Column(String(100), nullable=False)
-    
-    # Add year columns dynamically
-    locals().update(create_year_columns())
-    
-    created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune each new SQLite connection for fast bulk loads and non-blocking reads"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
 
 class DatabaseManager:
     """Database manager for handling SQLAlchemy operations"""
     
+    # Forecast years stored in the database, and the dtypes to read their CSV columns with
+    YEAR_RANGE = range(2025, 2051)
+    YEAR_DTYPES = {str(year): 'float64' for year in YEAR_RANGE}
+    
+    # Table model for each data type
+    MODEL_MAP = {
+        'water': WaterData,
+        'energy': EnergyData,
+        'home_capacity': HomeCapacityData
+    }
+    
     def __init__(self, db_url: str = "sqlite:///home_capacity_data.db"):
         """Initialize database manager"""
-        self.engine = create_engine(db_url)
+        if make_url(db_url).get_backend_name() == 'sqlite':
+            # SQLite has a single writer, so share one connection rather than reopening the file per checkout
+            self.engine = create_engine(db_url, insertmanyvalues_page_size=1000, poolclass=StaticPool,
+                                        connect_args={'check_same_thread': False})
+            event.listen(self.engine, 'connect', _set_sqlite_pragmas)
+        else:
+            self.engine = create_engine(db_url, insertmanyvalues_page_size=1000)
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
-        self.year_range = range(2025, 2051)
+        self.year_range = self.YEAR_RANGE
         
     def create_tables(self):
-        """Create all database tables"""
-        import os
-        
-        # Check if database file already exists
-        db_file = self.engine.url.database or 'home_capacity_data.db'
-        if os.path.exists(db_file):
-            print(f"Database file '{db_file}' already exists - using existing database")
-            self._data_exists = True
-        else:
-            print(f"Creating new database: {db_file}")
-            self._data_exists = False
-            
-        Base.metadata.create_all(bind=self.engine)
-        print("Database tables created successfully!")
+        """Create all database tables that do not exist yet"""
+        Base.metadata.create_all(bind=self.engine, checkfirst=True)
+        logger.info("Database tables created successfully!")
         
     def get_session(self):
         """Get a database session"""
         return self.SessionLocal()
     
-    def _create_year_data_dict(self, row: pd.Series, prefix: str = 'year_') -> dict:
-        """Create dictionary of year data from DataFrame row"""
-        return {f'{prefix}{year}': float(row.get(str(year), 0.0)) for year in self.year_range}
-    
-    def _load_data_generic(self, df: pd.DataFrame, model_class, additional_fields: dict = None):
-        """Generic method to load data into database"""
+    def _has_data(self, model_class) -> bool:
+        """Check whether a table already has any rows"""
         session = self.get_session()
         try:
-            for _, row in df.iterrows():
-                # Base fields
-                record_data = {
-                    'lad24cd': row['LAD24CD'],
-                    'lad24nm': row['LAD24NM'],
-                    **self._create_year_data_dict(row)
-                }
-                
-                record = model_class(**record_data)
-                session.add(record)
+            return session.query(model_class.id).first() is not None
+        finally:
+            session.close()
+    
+    def _to_long_format(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Reshape a wide DataFrame with one column per year into one row per (LAD, year)"""
+        year_cols = [str(year) for year in self.year_range if str(year) in df.columns]
+        long_df = df.melt(id_vars=['LAD24CD', 'LAD24NM'], value_vars=year_cols, var_name='year', value_name='value')
+        long_df = long_df.rename(columns={'LAD24CD': 'lad24cd', 'LAD24NM': 'lad24nm'})
+        long_df['year'] = long_df['year'].astype(int)
+        return long_df
+    
+    def _load_data_generic(self, df: pd.DataFrame, model_class, additional_fields: dict = None) -> bool:
+        """Generic method to load data into database, returning whether the load succeeded"""
+        try:
+            records = self._to_long_format(df).to_dict(orient='records')
+            # The tables are plain numeric loads, so skip the ORM and send one executemany INSERT
+            # in a single transaction (rolled back automatically on error)
+            with self.engine.begin() as conn:
+                conn.execute(model_class.__table__.insert(), records)
             
-            session.commit()
-            print(f"Loaded {len(df)} {model_class.__name__} records")
+            logger.info("Loaded %d %s records", len(records), model_class.__name__)
+            return True
         except Exception as e:
-            session.rollback()
-            print(f"Error loading {model_class.__name__} data: {e}")
+            logger.error("Error loading %s data: %s", model_class.__name__, e)
+            return False
+        
+    def fast_bulk_load(self, model_class, records: list):
+        """Insert records with one prepared executemany on the raw SQLite connection, bypassing SQLAlchemy"""
+        if self.engine.dialect.name != 'sqlite':
+            raise ValueError(f"fast_bulk_load only supports SQLite, not {self.engine.dialect.name}")
+        if not records:
+            return
+        
+        # The raw insert skips SQLAlchemy's column defaults, so fill the timestamps in SQL
+        columns = list(records[0])
+        sql = (f"INSERT INTO {model_class.__tablename__} ({', '.join(columns)}, created_at, updated_at) "
+               f"VALUES ({', '.join('?' * len(columns))}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)")
+        
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            cursor.executemany(sql, [tuple(record[col] for col in columns) for record in records])
+            cursor.close()
+            raw.commit()
+            logger.info("Loaded %d %s records", len(records), model_class.__name__)
+        except Exception:
+            raw.rollback()
+            raise
         finally:
-            session.close()
+            raw.close()
+        
+    @contextlib.contextmanager
+    def bulk_load_context(self):
+        """Drop the indexes of empty tables while loading them, and rebuild each index once afterwards"""
+        indexes = [index for model_class in self.MODEL_MAP.values() if not self._has_data(model_class)
+                   for index in model_class.__table__.indexes]
+        for index in indexes:
+            index.drop(bind=self.engine, checkfirst=True)
+        try:
+            yield self
+        finally:
+            for index in indexes:
+                index.create(bind=self.engine, checkfirst=True)
         
     def load_data(self, df: pd.DataFrame, data_type: str):
-        """Load data into database"""
-        if getattr(self, '_data_exists', False):
-            print(f"Skipping {data_type} data load - database already exists")
-            return
-            
-        model_map = {
-            'water': WaterData,
-            'energy': EnergyData,
-            'home_capacity': HomeCapacityData
-        }
+        """Load data into database, skipping tables that are already populated"""
+        model_map = self.MODEL_MAP
         
         if data_type not in model_map:
             raise ValueError(f"Unknown data type: {data_type}. Use 'water', 'energy', or 'home_capacity'")
+        
+        if self._has_data(model_map[data_type]):
+            logger.info("Skipping %s data load - table already has data", data_type)
+            return
             
-        self._load_data_generic(df, model_map[data_type])
-        print(f"Loaded {len(df)} {data_type} records")
-    
- 
\ No newline at end of file
+        if self._load_data_generic(df, model_map[data_type]):
+            logger.info("Loaded %d %s regions", len(df), data_type)
+
+@functools.lru_cache(maxsize=None)
+def get_db_manager(db_url: str = "sqlite:///home_capacity_data.db") -> DatabaseManager:
+    """Get the shared database manager for a database URL"""
+    return DatabaseManager(db_url)
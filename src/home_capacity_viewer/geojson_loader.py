@@ -0,0 +1,70 @@
+import gzip
+import logging
+import os
+
+import orjson
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+def load_geojson(url: str, cache_path: str, properties: tuple = ('LAD24CD', 'LAD24NM'),
+                 precision: int = 3) -> dict:
+    """
+    Load GeoJSON from a gzipped disk cache, downloading and simplifying it on first use.
+
+    Args:
+        url (str): URL of the GeoJSON payload
+        cache_path (str): Path of the gzipped cache file
+        properties (tuple): Feature properties to keep, all others are dropped
+        precision (int): Decimal places to round coordinates to. Defaults to 3 (~100m),
+                         which is below a pixel at the zoom levels the map is used at.
+
+    Returns:
+        dict: The simplified GeoJSON feature collection
+    """
+    if os.path.exists(cache_path):
+        logger.info("Using cached GeoJSON '%s'", cache_path)
+        with gzip.open(cache_path, 'rb') as f:
+            return orjson.loads(f.read())
+
+    logger.info("Downloading GeoJSON to '%s'", cache_path)
+    response = requests.get(url, timeout=60)
+    response.raise_for_status()
+    geojson_data = simplify_geojson(orjson.loads(response.content), properties, precision)
+
+    # Write to a temporary file first so an interrupted write never leaves a partial cache
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with gzip.open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(geojson_data))
+    os.replace(tmp_path, cache_path)
+
+    return geojson_data
+
+
+def simplify_geojson(geojson_data: dict, properties: tuple, precision: int) -> dict:
+    """
+    Drop unused feature properties and snap coordinates to a fixed precision.
+
+    Snapping removes the vertices that collapse onto their neighbour. Shared borders are
+    snapped identically on both sides, so adjacent regions stay gap-free.
+    """
+    for feature in geojson_data['features']:
+        feature['properties'] = {k: feature['properties'].get(k) for k in properties}
+        geometry = feature['geometry']
+        if geometry['type'] == 'Polygon':
+            geometry['coordinates'] = [_snap_ring(ring, precision) for ring in geometry['coordinates']]
+        elif geometry['type'] == 'MultiPolygon':
+            geometry['coordinates'] = [[_snap_ring(ring, precision) for ring in polygon]
+                                       for polygon in geometry['coordinates']]
+    return geojson_data
+
+
+def _snap_ring(ring: list, precision: int) -> list:
+    """Round a linear ring's coordinates and drop consecutive duplicate vertices"""
+    rounded = [[round(x, precision), round(y, precision)] for x, y, *_ in ring]
+    snapped = [point for i, point in enumerate(rounded) if i == 0 or point != rounded[i - 1]]
+
+    # Keep tiny rings that collapse below a valid polygon as rounded but unsnapped
+    return snapped if len(snapped) >= 4 else rounded
@@ -1,9 +1,71 @@
+import logging
 import os
-from typing import Dict
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterator, List, Optional
+import numpy as np
 import pandas as pd
-from home_capacity_viewer.settings import CLIENT,  MODEL
+from home_capacity_viewer.settings import CLIENT,  MODEL, EMBEDDING_MODEL, SEMANTIC_CACHE_THRESHOLD
 from home_capacity_viewer.data_processor import DataProcessor
 
+logger = logging.getLogger(__name__)
+
+# Static instructions, kept first in the system message so they form a stable prompt-cache prefix
+SYSTEM_INSTRUCTIONS = """You are an AI assistant communicating water supply and energy data for UK Local Authority Districts.
+This information has been used to also calculate total number of new homes based on water supply risk levels, energy supply surplus/deficit,
+and housing targets for each Local Authority District.
+
+You may have to sum values for different years and across different Local Authority Districts to get a total.
+
+Water supply data is categorized into risk levels:
+- High capacity (>1): Strong positive value, best for new homes
+- Low capacity (0-1): Weak positive value, limited capacity
+- Low risk deficit (-1 to 0): Small negative value, minor issues
+- High risk deficit (<-1): Large negative value, significant issues
+
+Energy data shows the energy surplus/deficit per Local Authority District per year when compared to housing targets
+in each year.
+
+Home capacity is calculated by multiplying the water supply risk level by the energy supply surplus/deficit,
+taking 0.1 as the number of homes per unit of excess energy in MW available.
+
+Format your responses using markdown:
+- Use **bold** for important values and trends
+- Use *italics* for emphasis
+- Separate paragraphs with blank lines
+- Use bullet points for lists
+- Use > for important notes or warnings
+
+Example format:
+**10,000 homes**: The total number of homes that there is capacity for in the UK in 2030. The Local Authority Districta
+with the highest home capacities are *London* (3,500 homes), *Manchester* (2,000 homes), and *Birmingham* (1,500 homes).
+
+ALWAYS start with the exact answer in bold, and explanation below.
+If a question refers to a specific table, use the data from that table.
+    (e.g. water utility --> water table,
+    energy infrastructure --> energy table,
+    building new homes --> home capacity table),
+only use the data from that table.
+Provide accurate and concise answers based on the data, and always quote numbers where you can.
+Explain whether analysis is based on water supply risk levels or energy supply surplus/deficit.
+"""
+
+# Data block appended after the instructions, filled from the handler's prepared context
+DATA_TEMPLATE = """
+You have access to the following data for all years:
+
+Water supply risk levels:
+{water}
+
+Home capacity taking into account both energy supply and housing targets:
+{energy}
+
+Home capacity based on both water supply risk levels and energy supply and housing targets:
+{home_capacity}
+"""
+
+
 class LLMQueryHandler:
     def __init__(self, water_data: pd.DataFrame, energy_data: pd.DataFrame):
         """
@@ -17,8 +79,42 @@ class LLMQueryHandler:
         processor = DataProcessor(water_data, energy_data)
         self.water_data, self.energy_data, self.home_capacity = processor.process_data()
         
+        # Year columns, worked out once. Home capacity shares the water data's years.
+        self.water_years = processor.year_cols
+        self.energy_years = [col for col in self.energy_data.columns if col not in ['LAD24CD', 'LAD24NM']]
+        
+        # The data never changes after initialisation, so build the context and system message once.
+        # Keeping the system message byte-identical across calls, with the static instructions ahead of
+        # the data, lets the provider reuse its prompt cache. Only the query goes in the user message.
+        self._context = self._prepare_context()
+        
+        self.system_message = SYSTEM_INSTRUCTIONS + DATA_TEMPLATE.format(**self._context)
+        
         self.client = CLIENT
         self.model = MODEL
+        
+        # Responses are deterministic (temperature 0) and the context is fixed for this handler,
+        # so responses are cached per normalised query (least recently used first). The normalised
+        # query is only the cache key, the model is always sent the question as asked.
+        self.response_cache_size = 256
+        self._response_cache: OrderedDict = OrderedDict()
+        self._response_cache_lock = threading.Lock()
+        
+        # Optional semantic cache of normalised query -> (unit query embedding, signature, response), oldest first
+        self.embedding_model = EMBEDDING_MODEL
+        self.similarity_threshold = SEMANTIC_CACHE_THRESHOLD
+        self.semantic_cache_size = 512
+        self._semantic_cache: OrderedDict = OrderedDict()
+        self._semantic_cache_lock = threading.Lock()
+        
+        # Questions differing only by year, figure or district embed almost identically, so a semantic hit
+        # also needs the same numbers and LAD names/codes. Longer names are tried first so that
+        # e.g. "North Yorkshire" is not read as "York".
+        lad_terms = {term.lower() for data in (self.water_data, self.energy_data)
+                     for col in ['LAD24CD', 'LAD24NM'] for term in data[col].astype(str)}
+        self._lad_pattern = re.compile(
+            r'\b(?:' + '|'.join(re.escape(term) for term in sorted(lad_terms, key=len, reverse=True)) + r')\b')
+        self._number_pattern = re.compile(r'\d+(?:[.,]\d+)*')
     
     def process_query(self, query: str) -> str:
         """
@@ -34,129 +130,133 @@ class LLMQueryHandler:
         if not query:
             return "Please enter a question about the water or energy supply data."
             
-        # Prepare the context with data for all years
-        context = self._prepare_context()
-        
-        # Create the system message with context
-        self.system_message = f"""You are an AI assistant communicating water supply and energy data for UK Local Authority Districts.
-        This information has been used to also calculate total number of new homes based on water supply risk levels, energy supply surplus/deficit,
-        and housing targets for each Local Authority District.
-
-        You have access to the following data for all years:
+        try:
+            # Repeated questions (ignoring case and whitespace) are answered from the cache
+            key = " ".join(query.lower().split())
+            with self._response_cache_lock:
+                if key in self._response_cache:
+                    self._response_cache.move_to_end(key)
+                    return self._response_cache[key]
+            
+            # Failed calls raise before reaching the cache, so errors are never cached
+            response = self._answer(query, key)
+            with self._response_cache_lock:
+                self._response_cache[key] = response
+                if len(self._response_cache) > self.response_cache_size:
+                    self._response_cache.popitem(last=False)
+            return response
+            
+        except Exception as e:
+            return f"Sorry, I encountered an error while processing your query: {str(e)}"
+    
+    def stream_query(self, query: str) -> Iterator[str]:
+        """
+        Process a user query and yield the response as it is generated.
         
-        Water supply risk levels:
-        {context['water']}
+        Streamed responses bypass the response cache, so use process_query for repeated questions.
         
-        Home capacity taking into account both energy supply and housing targets:
-        {context['energy']}
-
-        Home capacity based on both water supply risk levels and energy supply and housing targets:
-        {context['home_capacity']}
-
-        You may have to sum values for different years and across different Local Authority Districts to get a total.
-
-        Water supply data is categorized into risk levels:
-        - High capacity (>1): Strong positive value, best for new homes
-        - Low capacity (0-1): Weak positive value, limited capacity
-        - Low risk deficit (-1 to 0): Small negative value, minor issues
-        - High risk deficit (<-1): Large negative value, significant issues
-
-        Energy data shows the energy surplus/deficit per Local Authority District per year when compared to housing targets
-        in each year.
-
-        Home capacity is calculated by multiplying the water supply risk level by the energy supply surplus/deficit,
-        taking 0.1 as the number of homes per unit of excess energy in MW available. 
-
-        Format your responses using markdown:
-        - Use **bold** for important values and trends
-        - Use *italics* for emphasis
-        - Separate paragraphs with blank lines
-        - Use bullet points for lists
-        - Use > for important notes or warnings
-
-        Example format:
-        **10,000 homes**: The total number of homes that there is capacity for in the UK in 2030. The Local Authority Districta
-        with the highest home capacities are *London* (3,500 homes), *Manchester* (2,000 homes), and *Birmingham* (1,500 homes).
-    
-        ALWAYS start with the exact answer in bold, and explanation below.
-        If a question refers to a specific table, use the data from that table.
-            (e.g. water utility --> water table,
-            energy infrastructure --> energy table,
-            building new homes --> home capacity table),
-        only use the data from that table.
-        Provide accurate and concise answers based on the data, and always quote numbers where you can.
-        Explain whether analysis is based on water supply risk levels or energy supply surplus/deficit.
+        Args:
+            query (str): The user's text query
+            
+        Yields:
+            str: The next piece of the generated response
         """
-
+        if not query:
+            yield "Please enter a question about the water or energy supply data."
+            return
+        
         try:
-            # Make the API call
-            completion = self.client.chat.completions.create(
+            stream = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": self.system_message},
-                    {"role": "user", "content": query}
-                ],
-                temperature=0.5
+                messages=self._messages(query),
+                temperature=0,
+                stream=True
             )
+            for chunk in stream:
+                # Some chunks (e.g. content filter results) carry no choices or no content
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        
+        except Exception as e:
+            yield f"Sorry, I encountered an error while processing your query: {str(e)}"
+    
+    def _answer(self, query: str, key: str) -> str:
+        """Answer a query from the semantic cache when a similar question has been asked, otherwise from the model.
+        
+        The normalised key is embedded and stored, the query itself is what the model is sent."""
+        if not self.embedding_model:
+            return self._completion(query)
+        
+        # The semantic cache is optional, so an embedding failure must not stop the question being answered
+        try:
+            embedding = self._embed(key)
+        except Exception as e:
+            logger.error("Semantic cache embedding failed, answering without it: %s", e)
+            return self._completion(query)
+        
+        signature = self._query_signature(key)
+        response = self._semantic_lookup(embedding, signature)
+        if response is None:
+            response = self._completion(query)
+            self._semantic_store(key, embedding, signature, response)
+        return response
+    
+    def _query_signature(self, key: str) -> FrozenSet[str]:
+        """Get the numbers (years, figures) and LAD names/codes mentioned in a normalised query."""
+        return frozenset(self._number_pattern.findall(key)) | frozenset(self._lad_pattern.findall(key))
+    
+    def _embed(self, query: str) -> np.ndarray:
+        """Embed a query as a unit vector, so cosine similarity is a dot product."""
+        result = self.client.embeddings.create(model=self.embedding_model, input=query)
+        embedding = np.asarray(result.data[0].embedding, dtype=np.float32)
+        return embedding / np.linalg.norm(embedding)
+    
+    def _semantic_lookup(self, embedding: np.ndarray, signature: FrozenSet[str]) -> Optional[str]:
+        """Return the cached response for the most similar previous query with the same signature,
+        if it is similar enough."""
+        with self._semantic_cache_lock:
+            keys = [key for key, entry in self._semantic_cache.items() if entry[1] == signature]
+            if not keys:
+                return None
             
-            return completion.choices[0].message.content
+            similarities = np.stack([self._semantic_cache[key][0] for key in keys]) @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
             
-        except Exception as e:
-            return f"Sorry, I encountered an error while processing your query: {str(e)}"
+            self._semantic_cache.move_to_end(keys[best])
+            return self._semantic_cache[keys[best]][2]
+    
+    def _semantic_store(self, query: str, embedding: np.ndarray, signature: FrozenSet[str], response: str):
+        """Add a response to the semantic cache, evicting the least recently used entry when full."""
+        with self._semantic_cache_lock:
+            self._semantic_cache[query] = (embedding, signature, response)
+            self._semantic_cache.move_to_end(query)
+            if len(self._semantic_cache) > self.semantic_cache_size:
+                self._semantic_cache.popitem(last=False)
+    
+    def _completion(self, query: str) -> str:
+        """Send the query to the model with the data context and return the response text."""
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(query),
+            temperature=0
+        )
+        
+        return completion.choices[0].message.content
+    
+    def _messages(self, query: str) -> List[Dict[str, str]]:
+        """Build the chat messages for a query."""
+        return [
+            {"role": "system", "content": self.system_message},
+            {"role": "user", "content": query}
+        ]
     
     def _prepare_context(self) -> Dict[str, str]:
         """Prepare context data for all years."""
-        # Get all year columns (excluding LAD24CD and LAD24NM)
-        water_years = [col for col in self.water_data.columns if col not in ['LAD24CD', 'LAD24NM', 'risk_trend', 'risk_change_5yr', 'risk_avg', 'risk_std', 'risk_max', 'risk_min']]
-        energy_years = [col for col in self.energy_data.columns if col not in ['LAD24CD', 'LAD24NM', 'homes_trend', 'homes_change_5yr', 'homes_avg', 'homes_std', 'homes_max', 'homes_min']]
-        
-        # Prepare water data context
-        water_context = []
-        for _, row in self.water_data.iterrows():
-            region_data = []
-            for year in water_years:
-                value = row[year]
-                if value != "No data":  # Skip missing data
-                    region_data.append(f"{year}: {value}")
-            if region_data:  # Only include regions with data
-                water_context.append(
-                    f"{row['LAD24NM']}:\n"
-                    f"  Water Supply Risk Level: {' | '.join(region_data)}\n"
-                    f"  Trend: {row['risk_trend']}\n"
-                    f"  5-year change: {row['risk_change_5yr']:.1f}%\n"
-                    f"  Average Risk: {row['risk_avg']}\n"
-                    f"  Risk Range: {row['risk_min']} to {row['risk_max']}"
-                )
-        
-        # Prepare energy data context (now representing new homes)
-        energy_context = []
-        for _, row in self.energy_data.iterrows():
-            region_data = []
-            for year in energy_years:
-                value = row[year]
-                if value != 1000:  # Skip missing data
-                    region_data.append(f"{year}: {value:.0f} homes")
-            if region_data:  # Only include regions with data
-                energy_context.append(
-                    f"{row['LAD24NM']}:\n"
-                    f"  Energy Supply: {' | '.join(region_data)}\n"
-                    f"  Trend: {row['homes_trend']}\n"
-                    f"  5-year change: {row['homes_change_5yr']:.1f}%\n"
-                    f"  Average: {row['homes_avg']:.0f} homes\n"
-                    f"  Range: {row['homes_min']:.0f} to {row['homes_max']:.0f} homes"
-                )
-
-        home_capacity_context = []
-        for _, row in self.home_capacity.iterrows():
-            region_data = []
-            for year in self.home_capacity.columns[2:]:
-                value = row[year]
-                region_data.append(f"{year}: {value:.0f} homes")
-            if region_data:  # Only include regions with data
-                home_capacity_context.append(
-                    f"{row['LAD24NM']}:\n"
-                    f"  Home Capacity: {' | '.join(region_data)}\n"
-                )
+        water_context = self._format_regions(self.water_data, self.water_years, "Water Supply Risk Level", "{}", missing="No data")
+        energy_context = self._format_regions(self.energy_data, self.energy_years, "Energy Supply", "{:.0f} homes", missing=1000)
+        home_capacity_context = self._format_regions(self.home_capacity, self.water_years, "Home Capacity", "{:.0f} homes")
         
         return {
             'water': '\n'.join(water_context) if water_context else "No water risk data available.",
@@ -164,6 +264,24 @@ class LLMQueryHandler:
             'home_capacity': '\n'.join(home_capacity_context) if home_capacity_context else "No home capacity data available."
         }
     
+    def _format_regions(self, data: pd.DataFrame, years: List[str], label: str, value_format: str, missing=None) -> List[str]:
+        """Format one context entry per region, skipping missing values and regions without any data."""
+        values = data[years]
+        
+        # Format each distinct value once (the water risk levels only have a handful), then broadcast
+        # the formatted strings back and prefix them with their year
+        codes, uniques = pd.factorize(values.to_numpy().ravel(), use_na_sentinel=False)
+        formatted = np.array([value_format.format(value) for value in uniques], dtype=object)[codes]
+        year_labels = np.array([f"{year}: " for year in years], dtype=object)
+        cells = pd.DataFrame(year_labels + formatted.reshape(values.shape), index=data.index, columns=years)
+        if missing is not None:
+            cells = cells.where(values.ne(missing))
+        
+        # Join the remaining cells per region, dropping regions that have no values left
+        region_data = cells.stack(future_stack=True).dropna().groupby(level=0, sort=False).agg(' | '.join)
+        names = data['LAD24NM'].loc[region_data.index].astype(str)
+        return names.str.cat(region_data, sep=f":\n  {label}: ").tolist()
+    
 
     
     def _get_highest_value(self, data: pd.DataFrame, year: int, data_type: str) -> str:
@@ -172,9 +290,11 @@ class LLMQueryHandler:
         if year_col not in data.columns:
             return f"No data available for {year}"
             
-        max_idx = data[year_col].idxmax()
-        max_value = data.loc[max_idx, year_col]
-        region = data.loc[max_idx, 'LAD24NM']
+        # Positional lookup on the NumPy array avoids two label-based .loc lookups
+        values = data[year_col].to_numpy(dtype=np.float64)
+        max_pos = np.nanargmax(values)
+        max_value = values[max_pos]
+        region = data['LAD24NM'].iat[max_pos]
         
         return f"The highest {data_type} supply in {year} is in {region} with a value of {max_value:.2f}"
     
@@ -184,9 +304,11 @@ class LLMQueryHandler:
         if year_col not in data.columns:
             return f"No data available for {year}"
             
-        min_idx = data[year_col].idxmin()
-        min_value = data.loc[min_idx, year_col]
-        region = data.loc[min_idx, 'LAD24NM']
+        # Positional lookup on the NumPy array avoids two label-based .loc lookups
+        values = data[year_col].to_numpy(dtype=np.float64)
+        min_pos = np.nanargmin(values)
+        min_value = values[min_pos]
+        region = data['LAD24NM'].iat[min_pos]
         
         return f"The lowest {data_type} supply in {year} is in {region} with a value of {min_value:.2f}"
     
@@ -41,4 +41,9 @@ elif MODEL_PROVIDER == 'openai':
 
 else:
     raise ValueError(f"Invalid model provider: {MODEL_PROVIDER}. \
-                     Must be either 'openai' or 'azure'")
\ No newline at end of file
+                     Must be either 'openai' or 'azure'")
+
+# Semantic response cache settings (optional, disabled unless an embedding model is set).
+# For Azure this is the name of the embedding deployment.
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL")
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD") or "0.95")
\ No newline at end of file
@@ -9,6 +9,7 @@ sys.path.append('src')
 
 from home_capacity_viewer.database import DatabaseManager
 from home_capacity_viewer.data_processor import DataProcessor
+import numpy as np
 import pandas as pd
 
 def test_database_creation():
@@ -55,8 +56,8 @@ def test_data_loading():
         print(f"✅ Found energy CSV: {energy_csv_path}")
         
         # Load CSV data
-        water_output_csv = pd.read_csv(water_csv_path)
-        energy_output_csv = pd.read_csv(energy_csv_path)
+        water_output_csv = pd.read_csv(water_csv_path, dtype=DatabaseManager.YEAR_DTYPES)
+        energy_output_csv = pd.read_csv(energy_csv_path, dtype=DatabaseManager.YEAR_DTYPES)
         
         print(f"✅ Loaded water data: {len(water_output_csv)} rows")
         print(f"✅ Loaded energy data: {len(energy_output_csv)} rows")
@@ -69,50 +70,128 @@ def test_data_loading():
         print(f"✅ Processed energy data: {len(processed_energy_data)} rows")
         print(f"✅ Processed home capacity data: {len(processed_home_capacity)} rows")
         
-        # Initialize database
-        db_manager = DatabaseManager("sqlite:///test_loading.db")
-        db_manager.create_tables()
-        
-        # Load processed data into database
-        db_manager.load_water_data(processed_water_data)
-        db_manager.load_energy_data(processed_energy_data)
-        db_manager.load_home_capacity_data(processed_home_capacity)
-        
-        print("✅ All data loaded successfully into database!")
-        
-        # Test basic queries
         from home_capacity_viewer.database import WaterData, EnergyData, HomeCapacityData
-        session = db_manager.get_session()
-        water_count = session.query(WaterData).count()
-        energy_count = session.query(EnergyData).count()
-        capacity_count = session.query(HomeCapacityData).count()
-        session.close()
-        
-        print(f"✅ Database contains {water_count} water records")
-        print(f"✅ Database contains {energy_count} energy records")
-        print(f"✅ Database contains {capacity_count} home capacity records")
+        from sqlalchemy import inspect
         
-        # Clean up
-        if os.path.exists("test_loading.db"):
-            os.remove("test_loading.db")
-            print("✅ Test database cleaned up")
+        def table_counts(manager):
+            session = manager.get_session()
+            counts = {model_class.__tablename__: session.query(model_class).count()
+                      for model_class in (WaterData, EnergyData, HomeCapacityData)}
+            session.close()
+            return counts
         
-        return True
+        expected_rows = 7670  # 295 LADs x 26 years (2025-2050)
+        db_file = "test_loading.db"
+        managers = []
+        try:
+            # Load water and energy data, leaving the home capacity table empty
+            db_manager = DatabaseManager(f"sqlite:///{db_file}")
+            managers.append(db_manager)
+            db_manager.create_tables()
+            with db_manager.bulk_load_context():
+                db_manager.load_data(processed_water_data, 'water')
+                db_manager.load_data(processed_energy_data, 'energy')
+            
+            counts = table_counts(db_manager)
+            assert counts == {'water_data': expected_rows, 'energy_data': expected_rows, 'home_capacity_data': 0}, \
+                f"Unexpected row counts after the first load: {counts}"
+            print(f"✅ Loaded {expected_rows} water and energy records")
+            
+            # A second manager on the same file skips the loaded tables and fills in the empty one
+            second_manager = DatabaseManager(f"sqlite:///{db_file}")
+            managers.append(second_manager)
+            second_manager.create_tables()
+            with second_manager.bulk_load_context():
+                second_manager.load_data(processed_water_data, 'water')
+                second_manager.load_data(processed_energy_data, 'energy')
+                second_manager.load_data(processed_home_capacity, 'home_capacity')
+            
+            counts = table_counts(second_manager)
+            assert counts == {'water_data': expected_rows, 'energy_data': expected_rows, 'home_capacity_data': expected_rows}, \
+                f"Unexpected row counts after the second load: {counts}"
+            print(f"✅ Database contains {expected_rows} records per table, with no duplicates")
+            
+            # The bulk load indexes are rebuilt once loading is done
+            inspector = inspect(second_manager.engine)
+            for table_name in counts:
+                index_names = {index['name'] for index in inspector.get_indexes(table_name)}
+                assert f"ix_{table_name}_lad24cd_year" in index_names, \
+                    f"ix_{table_name}_lad24cd_year missing after bulk load: {sorted(index_names)}"
+            print("✅ LAD/year indexes rebuilt after bulk load")
+            
+            return True
+            
+        finally:
+            # Clean up, even if loading or the checks failed
+            for manager in managers:
+                manager.engine.dispose()
+            for path in (db_file, f"{db_file}-wal", f"{db_file}-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
         
+    except AssertionError:
+        raise
     except Exception as e:
         print(f"❌ Data loading test failed: {e}")
         import traceback
         traceback.print_exc()
         return False
 
+def test_fast_bulk_load():
+    """Test that the raw SQLite bulk load stores the same rows as the regular load"""
+    print("\nTesting fast bulk load...")
+    
+    water_output_csv = pd.read_csv('src/data/LA_water_output.csv', dtype=DatabaseManager.YEAR_DTYPES)
+    energy_output_csv = pd.read_csv('src/data/LA_energy_output.csv', dtype=DatabaseManager.YEAR_DTYPES)
+    processor = DataProcessor(water_output_csv, energy_output_csv)
+    _, processed_energy_data, _ = processor.process_data(convert_water_to_risk_level=False)
+    
+    from home_capacity_viewer.database import EnergyData
+    
+    managers = {}
+    try:
+        # Load the same data through the regular and the fast path
+        regular_manager = managers["test_regular_load.db"] = DatabaseManager("sqlite:///test_regular_load.db")
+        regular_manager.create_tables()
+        regular_manager.load_data(processed_energy_data, 'energy')
+        
+        fast_manager = managers["test_fast_load.db"] = DatabaseManager("sqlite:///test_fast_load.db")
+        fast_manager.create_tables()
+        records = fast_manager._to_long_format(processed_energy_data).to_dict(orient='records')
+        fast_manager.fast_bulk_load(EnergyData, records)
+        
+        def stored_rows(manager):
+            session = manager.get_session()
+            rows = session.query(EnergyData.lad24cd, EnergyData.lad24nm, EnergyData.year, EnergyData.value) \
+                .order_by(EnergyData.lad24cd, EnergyData.year).all()
+            session.close()
+            return rows
+        
+        regular_rows = stored_rows(regular_manager)
+        fast_rows = stored_rows(fast_manager)
+        
+        assert fast_rows == regular_rows and len(fast_rows) == len(records), \
+            f"Fast bulk load stored {len(fast_rows)} rows, regular load stored {len(regular_rows)}"
+        print(f"✅ Fast bulk load matches regular load: {len(fast_rows)} rows")
+        
+        return True
+        
+    finally:
+        # Clean up, even if loading or the check failed
+        for db_file, manager in managers.items():
+            manager.engine.dispose()
+            for path in (db_file, f"{db_file}-wal", f"{db_file}-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+
 def test_data_processing():
     """Test that data processing works correctly"""
     print("\nTesting data processing...")
     
     try:
         # Load actual CSV data
-        water_output_csv = pd.read_csv('src/data/LA_water_output.csv')
-        energy_output_csv = pd.read_csv('src/data/LA_energy_output.csv')
+        water_output_csv = pd.read_csv('src/data/LA_water_output.csv', dtype=DatabaseManager.YEAR_DTYPES)
+        energy_output_csv = pd.read_csv('src/data/LA_energy_output.csv', dtype=DatabaseManager.YEAR_DTYPES)
         
         # Test processing with risk levels (for app display)
         processor1 = DataProcessor(water_output_csv, energy_output_csv)
@@ -138,8 +217,20 @@ def test_data_processing():
             print(f"❌ Water data not kept as floats: {sample_water_value}")
             return False
         
+        # Check home capacity pairs each LAD's own water and energy rows (the CSVs are sorted differently)
+        lad_code = 'E06000001'
+        year_cols = [col for col in water_output_csv.columns if col not in ['LAD24CD', 'LAD24NM']]
+        water_row = water_output_csv.set_index('LAD24CD').loc[lad_code, year_cols].to_numpy(dtype=float)
+        energy_row = energy_output_csv.set_index('LAD24CD').loc[lad_code, year_cols].to_numpy(dtype=float)
+        capacity_row = home_capacity.set_index('LAD24CD').loc[lad_code, year_cols].to_numpy(dtype=float)
+        assert (capacity_row == (water_row > 0) * np.maximum(energy_row, 0)).all(), \
+            f"Home capacity for {lad_code} does not match its own water and energy rows"
+        print(f"✅ Home capacity for {lad_code} matches its water and energy rows")
+        
         return True
         
+    except AssertionError:
+        raise
     except Exception as e:
         print(f"❌ Data processing test failed: {e}")
         import traceback
@@ -152,7 +243,8 @@ if __name__ == "__main__":
     tests = [
         test_database_creation,
         test_data_processing,
-        test_data_loading
+        test_data_loading,
+        test_fast_bulk_load
     ]
     
     passed = 0
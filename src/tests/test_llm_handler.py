@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the LLM query handler's response caching and streaming with a fake client
+"""
+
+import sys
+import os
+from types import SimpleNamespace
+sys.path.append('src')
+
+# The settings module needs a provider configured before the handler can be imported
+os.environ.setdefault('MODEL_PROVIDER', 'openai')
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+
+from home_capacity_viewer.llm_handler import LLMQueryHandler
+import pandas as pd
+
+class FakeClient:
+    """Stand-in for the OpenAI client that records every chat and embedding call"""
+
+    def __init__(self, embeddings=None, fail_chat=False, fail_embedding=False, stream_chunks=None):
+        self.chat_calls = []
+        self.embedding_calls = []
+        self.embedding_vectors = embeddings or {}
+        self.fail_chat = fail_chat
+        self.fail_embedding = fail_embedding
+        self.stream_chunks = stream_chunks or []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+
+    def _create_completion(self, **kwargs):
+        self.chat_calls.append(kwargs)
+        if self.fail_chat:
+            raise RuntimeError("service unavailable")
+        if kwargs.get('stream'):
+            return iter(self.stream_chunks)
+        answer = f"Answer to: {kwargs['messages'][1]['content']}"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=answer))])
+
+    def _create_embedding(self, model, input):
+        self.embedding_calls.append(input)
+        if self.fail_embedding:
+            raise RuntimeError("embedding deployment not found")
+        return SimpleNamespace(data=[SimpleNamespace(embedding=self.embedding_vectors.get(input, [0.0, 1.0]))])
+
+def make_handler(client, embedding_model=None):
+    """Create a handler over a few real regions, wired to the fake client"""
+    water_output_csv = pd.read_csv('src/data/LA_water_output.csv').head(5)
+    energy_output_csv = pd.read_csv('src/data/LA_energy_output.csv').head(5)
+    handler = LLMQueryHandler(water_output_csv, energy_output_csv)
+    handler.client = client
+    handler.embedding_model = embedding_model
+    return handler
+
+def user_messages(client):
+    """Get the user message sent with each chat call"""
+    return [call['messages'][1]['content'] for call in client.chat_calls]
+
+def stream_chunk(content=None, has_choices=True):
+    """Build a streamed completion chunk"""
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if has_choices else []
+    return SimpleNamespace(choices=choices)
+
+def test_repeated_query_served_from_cache():
+    """Test that a case/whitespace variant of a question is answered from the cache"""
+    client = FakeClient()
+    handler = make_handler(client)
+
+    first = handler.process_query("Homes in  Adur vs E07000223?")
+    second = handler.process_query("homes in adur VS e07000223?")
+
+    assert second == first
+    assert user_messages(client) == ["Homes in  Adur vs E07000223?"], "The model should get the raw question once"
+
+def test_errors_not_cached():
+    """Test that a failed call is retried on the next identical question"""
+    client = FakeClient(fail_chat=True)
+    handler = make_handler(client)
+
+    assert handler.process_query("Total homes in 2030?").startswith("Sorry, I encountered an error")
+    client.fail_chat = False
+    assert handler.process_query("Total homes in 2030?") == "Answer to: Total homes in 2030?"
+    assert len(client.chat_calls) == 2
+
+def test_response_cache_eviction():
+    """Test that the least recently used response is evicted at response_cache_size"""
+    client = FakeClient()
+    handler = make_handler(client)
+    handler.response_cache_size = 2
+
+    handler.process_query("first question")
+    handler.process_query("second question")
+    handler.process_query("first question")  # Refreshes "first question"
+    handler.process_query("third question")  # Evicts "second question"
+
+    assert list(handler._response_cache) == ["first question", "third question"]
+    handler.process_query("second question")
+    assert user_messages(client) == ["first question", "second question", "third question", "second question"]
+
+def test_embedding_failure_falls_back_to_completion():
+    """Test that a failing embedding call still answers the question, without the semantic cache"""
+    client = FakeClient(fail_embedding=True)
+    handler = make_handler(client, embedding_model="test-embedding")
+
+    assert handler.process_query("Homes in Adur in 2030?") == "Answer to: Homes in Adur in 2030?"
+    assert client.embedding_calls == ["homes in adur in 2030?"]
+    assert len(handler._semantic_cache) == 0
+
+def test_semantic_hit_skips_completion():
+    """Test that a similar enough question with the same years and districts reuses the cached answer"""
+    client = FakeClient(embeddings={
+        "how many homes can adur build in 2030?": [1.0, 0.0],
+        "what is adur's home capacity in 2030?": [0.99, 0.1],
+        "what is adur's home capacity in 2040?": [0.99, 0.1],
+    })
+    handler = make_handler(client, embedding_model="test-embedding")
+    handler.similarity_threshold = 0.95
+
+    first = handler.process_query("How many homes can Adur build in 2030?")
+    assert handler.process_query("What is Adur's home capacity in 2030?") == first
+    assert len(client.chat_calls) == 1, "A semantic hit should skip chat.completions.create"
+
+    # Same wording but a different year must not reuse the 2030 answer
+    handler.process_query("What is Adur's home capacity in 2040?")
+    assert len(client.chat_calls) == 2
+
+def test_stream_query_skips_empty_chunks():
+    """Test that streaming yields only chunks with content, and sends the raw question"""
+    client = FakeClient(stream_chunks=[
+        stream_chunk(has_choices=False),
+        stream_chunk("Adur has "),
+        stream_chunk(None),
+        stream_chunk("**120 homes**"),
+    ])
+    handler = make_handler(client)
+
+    assert list(handler.stream_query("Homes in  Adur?")) == ["Adur has ", "**120 homes**"]
+    assert user_messages(client) == ["Homes in  Adur?"]
+    assert client.chat_calls[0]['stream'] is True
+
+if __name__ == "__main__":
+    print("🧪 Testing LLM Query Handler\n")
+
+    tests = [
+        test_repeated_query_served_from_cache,
+        test_errors_not_cached,
+        test_response_cache_eviction,
+        test_embedding_failure_falls_back_to_completion,
+        test_semantic_hit_skips_completion,
+        test_stream_query_skips_empty_chunks
+    ]
+
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+
+    print(f"\n🎉 All {len(tests)} tests passed!")